@@ -7,6 +7,7 @@ import os
 
 # you can add your own settings
 BASE_URL = "http://localhost:8000"  # used in canonical tags (which need absolute urls) in base.html
+RUNCHEAP_SSG_SITEMAP_BASE_URL = BASE_URL  # sitemaps also need absolute urls
 
 # since this project is used to generate a static site, no need for typical wsgi settings
 DEBUG = True  # not used, but helpful for troubleshooting
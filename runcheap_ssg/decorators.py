@@ -9,6 +9,10 @@ def include_in_ssg(function=None, ssg_reverse_iter=None):
     `ssg_reverse_iter` kwarg (the default is `[{}]`, which means
     one page is built with no url pattern parameters).
 
+    Each `ssg_reverse_iter` item can also have a "lastmod" item (a date,
+    datetime, or string), which is used as the page's <lastmod> in the
+    sitemap (e.g. `{"kwargs": {"slug": "abc"}, "lastmod": post.updated}`).
+
     NOTE: Your url patterns MUST have a `name` attribute, since
     building the static site uses Django's reverse() to generate
     url for each of the `ssg_reverse_iter` items.
@@ -1,13 +1,19 @@
 import os
+import json
 import shutil
+import hashlib
 import logging
+import mimetypes
 import importlib
+from datetime import datetime
 from textwrap import dedent
+from xml.sax.saxutils import escape, quoteattr
 from urllib.parse import urlparse
 from django.urls import URLPattern, URLResolver, reverse
 from django.urls.resolvers import LocalePrefixPattern
+from django.utils import timezone
 from django.utils.translation import activate, get_language
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from django.contrib.staticfiles.finders import get_finder
 from django.template.loader import render_to_string
@@ -35,27 +41,43 @@ DEFAULT_REDIRECT_NOSCRIPT = getattr(
     "RUNCHEAP_SSG_REDIRECT_NOSCRIPT",
     "If you are not redirected automatically, follow this link:",
 )
+DEFAULT_MANIFEST = getattr(
+    settings,
+    "RUNCHEAP_SSG_MANIFEST",
+    "runcheap_ssg_manifest.json",
+)
+DEFAULT_SITEMAP = getattr(
+    settings,
+    "RUNCHEAP_SSG_SITEMAP",
+    "sitemap.xml",
+)
+DEFAULT_SITEMAP_BASE_URL = getattr(
+    settings,
+    "RUNCHEAP_SSG_SITEMAP_BASE_URL",
+    None,
+)
+MANIFEST_VERSION = 1
 
 
-def get_static_content(urlpatterns, namespace=tuple(), redirect_context=None, also_handle_nolang=False):
+def get_static_urls(urlpatterns, namespace=tuple(), also_handle_nolang=False):
     """
-    This function scans a list of urlpatterns and yields rendered pages (or redirects)
-    for those url patterns. It only will render pages for url pattern entries that have
-    a view that has a .ssg_reverse_iter attribute (which is added by the @included_in_ssg
-    decorator). Pages are rendered using Django's built-in testing Client(), so the
-    rendered pages and redirect behavior detected is the same as if you were making
-    requests while running tests.
-
-    For internationalized url patterns (e.g. /en/about/), a render for each language in
-    settings.LANGUAGES is yielded, plus a redirect for the non-internationalized url to
-    the settings.LANGUAGE_CODE default language (e.g. /about/ --> /en/about/).
-
-    For urls that have an appended slash and settings.APPEND_SLASH is enabled, a render
-    of the page at the appended slash versions is yielded (e.g. /faq/) and a redirect
-    for the non-slash version is also yielded (e.g. /faq --> /faq/).
-
-    Redirects are rendered as html pages with a meta http-equiv="refresh" tag and a
-    javascript location.href redirect to the desired url.
+    This function scans a list of urlpatterns and yields the urls to render for the
+    static site (without rendering them), along with a dict of info about the page
+    each url is for. It only yields urls for url pattern entries that have a view that
+    has a .ssg_reverse_iter attribute (which is added by the @included_in_ssg decorator).
+
+    For internationalized url patterns (e.g. /en/about/), a url for each language in
+    settings.LANGUAGES is yielded (while that language is activated), plus the
+    non-internationalized url that redirects to the settings.LANGUAGE_CODE default
+    language (e.g. /about/ --> /en/about/).
+
+    For urls that have an appended slash and settings.APPEND_SLASH is enabled, the
+    appended slash version is yielded (e.g. /faq/) along with the non-slash version
+    that redirects to it (e.g. /faq --> /faq/).
+
+    The page info dict has the page's primary "url" (i.e. not one of its redirect urls),
+    its "view_name" and "reverse_kwargs", the optional "lastmod" from the page's
+    `ssg_reverse_iter` item, and the "language" that was active for the page.
     """
     for entry in urlpatterns:
 
@@ -71,25 +93,23 @@ def get_static_content(urlpatterns, namespace=tuple(), redirect_context=None, al
                     if entry.pattern.prefix_default_language and lang == settings.LANGUAGE_CODE:
                         also_handle_nolang = True
                     activate(lang)
-                    for content_path, content_iter in get_static_content(
+                    for view_url, page in get_static_urls(
                         entry.url_patterns,
                         namespace=new_namespace,
-                        redirect_context=redirect_context,
                         also_handle_nolang=also_handle_nolang,
                     ):
-                        yield content_path, content_iter
+                        yield view_url, page
                     also_handle_nolang = cur_also_handle_nolang
                 # reset to language
                 activate(cur_lang)
             # include() views
             else:
-                for content_path, content_iter in get_static_content(
+                for view_url, page in get_static_urls(
                     entry.url_patterns,
                     namespace=new_namespace,
-                    redirect_context=redirect_context,
                     also_handle_nolang=also_handle_nolang,
                 ):
-                    yield content_path, content_iter
+                    yield view_url, page
 
         # individual view
         elif isinstance(entry, URLPattern):
@@ -104,10 +124,12 @@ def get_static_content(urlpatterns, namespace=tuple(), redirect_context=None, al
                     reverse_kwargs_iter = reverse_kwargs_iter()
 
                 # generate individual pages for the view (default is just one page per view)
-                view_urls = []
                 view_name = ":".join(n for n in list(namespace) + [entry.name])
 
                 for reverse_kwargs in reverse_kwargs_iter:
+                    # the optional "lastmod" item is for the sitemap, not a reverse() kwarg
+                    reverse_kwargs = dict(reverse_kwargs)
+                    lastmod = reverse_kwargs.pop("lastmod", None)
                     page_urls = [reverse(view_name, **reverse_kwargs)]
 
                     # for language pages where the prefix is always added (i.e. prefix_default_language=True),
@@ -124,47 +146,252 @@ def get_static_content(urlpatterns, namespace=tuple(), redirect_context=None, al
                             if noslash_url:
                                 page_urls.append(noslash_url)
 
-                    view_urls.extend(page_urls)
-
-                # render the view's set of urls as static content
-                for view_url in view_urls:
-
-                    # fake a request to the page
-                    resp = Client().get(view_url, follow=False)
-
-                    # render any TemplateResponse views
-                    if hasattr(resp, "render"):
-                        resp.render()
-
-                    # handle redirects
-                    if resp.status_code in {301, 302} and resp.get("Location"):
-                        content_iter = [
-                            render_to_string(
-                                "runcheap_ssg/redirect.html",
-                                redirect_context | {"redirect_url": resp["Location"]},
-                            ).encode()
-                        ]
-                    # handle streaming content
-                    elif hasattr(resp, "streaming_content"):
-                        content_iter = resp.streaming_content
-                    # handle fixed content
-                    else:
-                        content_iter = [resp.content]
-
-                    # handle urls ending with slashes
-                    if view_url.endswith("/"):
-                        content_path = view_url[:-1] + "/index.html"
-                    # handle html pages without a suffix
-                    elif (resp.get("Content-Type") or "").startswith("text/html") and not view_url.endswith(
-                        (".html", ".htm")
-                    ):
-                        content_path = view_url + ".html"
-                    # default is to just save the content to the view url's path
-                    else:
-                        content_path = view_url
+                    # yield the page's set of urls
+                    # (one page at a time, so memory use doesn't grow with the number of pages)
+                    page = {
+                        "url": page_urls[0],
+                        "view_name": view_name,
+                        "reverse_kwargs": reverse_kwargs,
+                        "lastmod": lastmod,
+                        "language": get_language(),
+                    }
+                    for view_url in page_urls:
+                        yield view_url, page
+
+
+def render_static_content(view_url, redirect_context=None):
+    """
+    This function renders a single url of the static site and returns the path of the
+    static file for it, an iterator of the file's content, and whether the url is an
+    html page (i.e. a 200 response, not a redirect, error, or non-html content). Pages are rendered using
+    Django's built-in testing Client(), so the rendered pages and redirect behavior
+    detected is the same as if you were making requests while running tests.
+
+    Redirects are rendered as html pages with a meta http-equiv="refresh" tag and a
+    javascript location.href redirect to the desired url.
+    """
+
+    # fake a request to the page
+    resp = Client().get(view_url, follow=False)
+
+    # render any TemplateResponse views
+    if hasattr(resp, "render"):
+        resp.render()
+
+    # handle redirects
+    is_redirect = resp.status_code in {301, 302} and resp.get("Location")
+    if is_redirect:
+        content_iter = [
+            render_to_string(
+                "runcheap_ssg/redirect.html",
+                redirect_context | {"redirect_url": resp["Location"]},
+            ).encode()
+        ]
+    # handle streaming content
+    elif hasattr(resp, "streaming_content"):
+        content_iter = resp.streaming_content
+    # handle fixed content
+    else:
+        content_iter = [resp.content]
+
+    # handle urls ending with slashes
+    is_html = (resp.get("Content-Type") or "").startswith("text/html")
+    if view_url.endswith("/"):
+        content_path = view_url[:-1] + "/index.html"
+    # handle html pages without a suffix
+    elif is_html and not view_url.endswith((".html", ".htm")):
+        content_path = view_url + ".html"
+    # default is to just save the content to the view url's path
+    else:
+        content_path = view_url
+
+    return content_path, content_iter, resp.status_code == 200 and is_html
+
+
+def get_static_content(urlpatterns, namespace=tuple(), redirect_context=None, also_handle_nolang=False, sitemap=None):
+    """
+    This function scans a list of urlpatterns and yields rendered pages (or redirects)
+    for those url patterns, as (static file path, content iterator) pairs. The urls are
+    found with get_static_urls() and each one is rendered with render_static_content().
+
+    If a `sitemap` (e.g. a SitemapWriter) is provided, each html page that rendered
+    successfully (but not redirects, errors, or non-html content) is added to it along
+    with its translations and any "lastmod" value from the page's `ssg_reverse_iter` item.
+    """
+    for view_url, page in get_static_urls(urlpatterns, namespace=namespace, also_handle_nolang=also_handle_nolang):
+        content_path, content_iter, is_page = render_static_content(view_url, redirect_context=redirect_context)
+
+        # only the page's primary url goes in the sitemap (the other urls are redirects to it)
+        if sitemap is not None and is_page and view_url == page["url"]:
+            alternates = get_language_urls(page["view_name"], page["reverse_kwargs"])
+            sitemap.add(view_url, lastmod=page["lastmod"], alternates=alternates)
+
+        # map the view's content to it's static file
+        yield content_path, content_iter
 
-                    # map the view's content to it's static file
-                    yield content_path, content_iter
+
+def get_language_urls(view_name, reverse_kwargs):
+    """
+    This function returns a {language code: url} dict of a page's translations
+    (e.g. for `hreflang` alternates), or None if the page isn't translated
+    (i.e. the page's url is the same for every language in settings.LANGUAGES).
+    """
+    cur_lang = get_language()
+    language_urls = {}
+    for lang, _ in settings.LANGUAGES:
+        activate(lang)
+        language_urls[lang] = reverse(view_name, **reverse_kwargs)
+    activate(cur_lang)
+    return language_urls if len(set(language_urls.values())) > 1 else None
+
+
+def check_sitemap_name(index_name):
+    """
+    This function raises a ValueError if the sitemap index name isn't a file name
+    (sitemaps are saved in the root of the site, see SitemapWriter).
+    """
+    if not index_name or "/" in index_name or os.sep in index_name or index_name in {".", ".."}:
+        raise ValueError(f"Sitemap must be a file name in the root of the output directory: '{index_name}'")
+
+
+class SitemapWriter:
+    """
+    Streaming sitemap writer, which saves the sitemap files for the pages added to it while the site is being built.
+
+    Pages are written to numbered sitemap files (e.g. "sitemap-1.xml", "sitemap-2.xml", etc.) as they are added,
+    starting a new file whenever the current one reaches the sitemap protocol's limits (50,000 urls or 50MB), so
+    memory use doesn't grow with the size of the site. When closed, a sitemap index (e.g. "sitemap.xml") that
+    lists all of the sitemap files is saved.
+
+    Sitemaps require absolute urls, so `base_url` (e.g. "https://example.com") is prepended to every url.
+    All of the sitemap files are saved in the root of the site, since a sitemap can only list urls that are
+    in its own folder (or below it), so `index_name` must be a file name (not a path).
+    """
+
+    MAX_URLS = 50000
+    MAX_BYTES = 50 * 1024 * 1024
+    HEADER = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" xmlns:xhtml="http://www.w3.org/1999/xhtml">\n'
+    ).encode()
+    FOOTER = "</urlset>\n".encode()
+
+    def __init__(self, folder, base_url, index_name=DEFAULT_SITEMAP):
+        self.folder = folder
+        self.base_url = base_url.rstrip("/")
+        self.index_name = index_name
+        self.sitemap_names = []
+        self.sitemap_file = None
+        self.sitemap_urls = 0
+        self.sitemap_bytes = 0
+        check_sitemap_name(index_name)
+
+    def add(self, url, lastmod=None, alternates=None):
+        "Write a page's <url> entry (`alternates` is a {language code: url} dict of the page's translations)"
+        entry = f"<url><loc>{escape(self.base_url + url)}</loc>"
+        if isinstance(lastmod, datetime) and timezone.is_naive(lastmod):
+            # the sitemap protocol requires a timezone for times
+            lastmod = timezone.make_aware(lastmod)
+        if lastmod is not None:
+            entry += f"<lastmod>{escape(lastmod if isinstance(lastmod, str) else lastmod.isoformat())}</lastmod>"
+        for lang, alt_url in (alternates or {}).items():
+            href = quoteattr(self.base_url + alt_url)
+            entry += f'<xhtml:link rel="alternate" hreflang={quoteattr(lang)} href={href}/>'
+        entry = (entry + "</url>\n").encode()
+
+        # start a new sitemap file if this entry doesn't fit in the current one
+        if self.sitemap_file is not None and (
+            self.sitemap_urls >= self.MAX_URLS or self.sitemap_bytes + len(entry) + len(self.FOOTER) > self.MAX_BYTES
+        ):
+            self._close_sitemap()
+        if self.sitemap_file is None:
+            stem, ext = os.path.splitext(self.index_name)
+            self.sitemap_names.append(f"{stem}-{len(self.sitemap_names) + 1}{ext}")
+            self.sitemap_file = open(os.path.join(self.folder, self.sitemap_names[-1]), "wb")
+            self.sitemap_file.write(self.HEADER)
+            self.sitemap_urls = 0
+            self.sitemap_bytes = len(self.HEADER)
+
+        self.sitemap_file.write(entry)
+        self.sitemap_urls += 1
+        self.sitemap_bytes += len(entry)
+
+    def _close_sitemap(self):
+        self.sitemap_file.write(self.FOOTER)
+        self.sitemap_file.close()
+        self.sitemap_file = None
+
+    def close(self):
+        "Finish the last sitemap file and save the sitemap index, then return the paths of all the saved files"
+        if self.sitemap_file is not None:
+            self._close_sitemap()
+        index_path = os.path.join(self.folder, self.index_name)
+        with open(index_path, "w") as index_file:
+            index_file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            index_file.write('<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+            for sitemap_name in self.sitemap_names:
+                index_file.write(f"<sitemap><loc>{escape(self.base_url + '/' + sitemap_name)}</loc></sitemap>\n")
+            index_file.write("</sitemapindex>\n")
+        return [os.path.join(self.folder, name) for name in self.sitemap_names] + [index_path]
+
+
+def get_manifest_entry(out_path, content_hash=None):
+    """
+    This function returns the manifest entry (content hash, size, and content type)
+    for a file in the build folder. The content type is guessed from the file name,
+    the same way the `runcheap_ssg_serve` command does, so it matches what a static
+    http server (or an object store) will send for the file.
+
+    If the file's sha256 hash was already calculated while writing it, pass it as
+    the `content_hash` kwarg to skip reading the file back from disk.
+    """
+    if content_hash is None:
+        hasher = hashlib.sha256()
+        with open(out_path, "rb") as in_file:
+            for chunk in iter(lambda: in_file.read(65536), b""):
+                hasher.update(chunk)
+        content_hash = hasher.hexdigest()
+    return {
+        "hash": content_hash,
+        "size": os.path.getsize(out_path),
+        "content_type": mimetypes.guess_type(out_path)[0] or "application/octet-stream",
+    }
+
+
+def get_output_path(folder, path):
+    """
+    This function returns the absolute path of a file inside the build folder
+    (e.g. for the manifest), raising a ValueError if the path is outside of it.
+    """
+    out_path = os.path.abspath(os.path.join(folder, path))
+    if not out_path.startswith(os.path.abspath(folder) + os.sep):
+        raise ValueError(f"Path must be inside the output directory: {path}")
+    return out_path
+
+
+def save_manifest(folder, manifest, files):
+    """
+    This function writes a build manifest, which is a json file that maps each
+    output path (relative to the build folder) to its manifest entry. Manifests
+    from two builds can be compared with the `runcheap_ssg_diff` command to find
+    what needs to be uploaded or deleted when deploying.
+
+    The manifest also records its own path in the build folder, so the build
+    folder can be found from the manifest's location.
+    """
+    manifest_path = get_output_path(folder, manifest)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(
+            {
+                "version": MANIFEST_VERSION,
+                "path": os.path.relpath(manifest_path, folder).replace(os.sep, "/"),
+                "files": dict(sorted(files.items())),
+            },
+            manifest_file,
+            indent=1,
+        )
+    return manifest_path
 
 
 def build_static_from_urlpatterns(
@@ -175,16 +402,29 @@ def build_static_from_urlpatterns(
     redirect_message=DEFAULT_REDIRECT_MESSAGE,
     redirect_noscript=DEFAULT_REDIRECT_NOSCRIPT,
     staticfiles_ignore=None,
+    manifest=DEFAULT_MANIFEST,
+    sitemap=DEFAULT_SITEMAP,
+    sitemap_base_url=DEFAULT_SITEMAP_BASE_URL,
 ):
     """
     This is the primary entry point for building the static site.
     With the various kwargs for this function, you can customize
     various build options for the generated static site.
+
+    Unless `manifest` is empty, a build manifest listing every output
+    file is saved to that path (relative paths are inside the build folder).
+
+    If `sitemap_base_url` and `sitemap` are set, a sitemap index is saved to the
+    `sitemap` file name in the root of the build folder (with the sitemap files
+    it lists saved next to it).
     """
+    folder = os.path.abspath(output_dir)
+    manifest_files = {}
+    if manifest:
+        get_output_path(folder, manifest)
 
     # clear the existing output directory
     if output_clear:
-        folder = os.path.abspath(output_dir)
         os.makedirs(folder, exist_ok=True)
         for f in os.listdir(folder):
             path = os.path.join(folder, f)
@@ -195,6 +435,9 @@ def build_static_from_urlpatterns(
 
     # build the static content
     urlconf_module = importlib.import_module(urlconf)
+    sitemap_writer = None
+    if sitemap_base_url and sitemap:
+        sitemap_writer = SitemapWriter(folder, sitemap_base_url, index_name=sitemap)
     content_generator = get_static_content(
         urlconf_module.urlpatterns,
         redirect_context={
@@ -202,6 +445,7 @@ def build_static_from_urlpatterns(
             "redirect_message": redirect_message,
             "redirect_noscript": redirect_noscript,
         },
+        sitemap=sitemap_writer,
     )
 
     # save the content to the output directory
@@ -211,9 +455,22 @@ def build_static_from_urlpatterns(
         out_dir = os.path.dirname(out_path)
         os.makedirs(out_dir, exist_ok=True)
         out_file = open(out_path, "wb")
+        hasher = hashlib.sha256()
         for content_chunk in content_iter:
             out_file.write(content_chunk)
+            hasher.update(content_chunk)
         out_file.close()
+        manifest_files[content_url[1:]] = get_manifest_entry(out_path, content_hash=hasher.hexdigest())
+
+    # finish the sitemaps that were written while building
+    if sitemap_writer is not None:
+        sitemap_paths = sitemap_writer.close()
+        for out_path in sitemap_paths:
+            logger.info(f"output (sitemap): {out_path.split(folder, 1)[1]}")
+            # marked so deploys can upload the sitemaps after the pages, and the index last
+            sitemap_type = "index" if out_path == sitemap_paths[-1] else "shard"
+            manifest_entry = get_manifest_entry(out_path) | {"sitemap": sitemap_type}
+            manifest_files[os.path.relpath(out_path, folder).replace(os.sep, "/")] = manifest_entry
 
     # collect any django staticfiles content (if configured to do so)
     if settings.STATIC_URL:
@@ -229,6 +486,12 @@ def build_static_from_urlpatterns(
                 logger.info(f"output (staticfile): {out_path.split(folder, 1)[1]}")
                 os.makedirs(os.path.dirname(out_path), exist_ok=True)
                 shutil.copy(source_path, out_path)
+                manifest_files[os.path.relpath(out_path, folder).replace(os.sep, "/")] = get_manifest_entry(out_path)
+
+    # save the manifest of everything that was built
+    if manifest:
+        manifest_path = save_manifest(folder, manifest, manifest_files)
+        logger.info(f"output (manifest): {manifest_path}")
 
 
 class Command(BaseCommand):
@@ -293,7 +556,45 @@ class Command(BaseCommand):
             ),
         )
 
+        parser.add_argument(
+            "--manifest",
+            metavar="STRING",
+            default=DEFAULT_MANIFEST,
+            help=(
+                f"Where to save the build manifest, relative to the output directory "
+                f"(default is '{DEFAULT_MANIFEST}', use an empty string to not save a manifest)"
+            ),
+        )
+        parser.add_argument(
+            "--sitemap",
+            metavar="STRING",
+            default=DEFAULT_SITEMAP,
+            help=(
+                f"File name of the sitemap index, saved in the root of the output directory "
+                f"(default is '{DEFAULT_SITEMAP}', use an empty string to not save a sitemap)"
+            ),
+        )
+        parser.add_argument(
+            "--sitemap-base-url",
+            metavar="STRING",
+            default=DEFAULT_SITEMAP_BASE_URL,
+            help=(
+                "Absolute url of the static site (e.g. 'https://example.com') to use in the sitemap "
+                f"(default is '{DEFAULT_SITEMAP_BASE_URL}', no sitemap is saved if not set)"
+            ),
+        )
+
     def handle(self, *args, **options):
+        if options["manifest"]:
+            try:
+                get_output_path(options["output"], options["manifest"])
+            except ValueError as e:
+                raise CommandError(f"--manifest: {e}")
+        if options["sitemap"] and options["sitemap_base_url"]:
+            try:
+                check_sitemap_name(options["sitemap"])
+            except ValueError as e:
+                raise CommandError(f"--sitemap: {e}")
         build_static_from_urlpatterns(
             output_dir=options["output"],
             output_clear=bool(not options["output_noclear"]),
@@ -302,4 +603,7 @@ class Command(BaseCommand):
             redirect_message=options["redirect_message"],
             redirect_noscript=options["redirect_noscript"],
             staticfiles_ignore=options["staticfiles_ignore"],
+            manifest=options["manifest"],
+            sitemap=options["sitemap"],
+            sitemap_base_url=options["sitemap_base_url"],
         )
@@ -0,0 +1,221 @@
+import os
+import json
+import shutil
+import logging
+from textwrap import dedent
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.utils.module_loading import import_string
+from runcheap_ssg.management.commands.runcheap_ssg_build import get_manifest_entry
+
+DEFAULT_SYNC_TARGET = getattr(
+    settings,
+    "RUNCHEAP_SSG_SYNC_TARGET",
+    "runcheap_ssg.management.commands.runcheap_ssg_diff.LocalDirectoryTarget",
+)
+DEFAULT_SYNC_WORKERS = getattr(
+    settings,
+    "RUNCHEAP_SSG_SYNC_WORKERS",
+    8,
+)
+
+logger = logging.getLogger("django.runcheap_ssg.diff_static")
+
+
+class LocalDirectoryTarget:
+    """
+    Sync target that copies files to a local directory. This is a stand-in for
+    a real deployment target (e.g. an object store bucket), and also the example
+    for writing your own target, which only needs to implement `upload()` and
+    `delete()` (both of which are called from multiple threads at once).
+
+    The target class is constructed with the `--sync-to` destination string.
+    """
+
+    def __init__(self, destination):
+        self.directory = os.path.abspath(destination)
+
+    def upload(self, path, source_path, entry):
+        "Copy the file at `source_path` to `path` (`entry` has the content hash, size, and content type)"
+        out_path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        shutil.copy(source_path, out_path)
+
+    def delete(self, path):
+        "Remove the file at `path` and any parent folders left empty (missing files are ignored)"
+        out_path = os.path.join(self.directory, path)
+        try:
+            os.remove(out_path)
+        except FileNotFoundError:
+            pass
+
+        # remove empty parent folders, stopping at the first one that isn't empty
+        # (or that another thread already removed)
+        out_dir = os.path.dirname(out_path)
+        while out_dir != self.directory and out_dir.startswith(self.directory + os.sep):
+            try:
+                os.rmdir(out_dir)
+            except OSError:
+                break
+            out_dir = os.path.dirname(out_dir)
+
+
+def load_manifest(manifest_path):
+    """
+    This function loads a build manifest (saved by the `runcheap_ssg_build` command).
+    A manifest that doesn't exist is treated as an empty build (e.g. for the very first deploy).
+    """
+    if not os.path.exists(manifest_path):
+        logger.warning(f"Manifest not found, treating as empty: {manifest_path}")
+        return {"files": {}}
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def get_build_dir(manifest_path, manifest):
+    """
+    This function returns the build folder of a manifest, using the manifest's own
+    path in the build folder (manifests without it are in the build folder's root).
+    """
+    build_dir = os.path.abspath(manifest_path)
+    for _ in manifest.get("path", os.path.basename(manifest_path)).split("/"):
+        build_dir = os.path.dirname(build_dir)
+    return build_dir
+
+
+def diff_manifests(old_files, new_files):
+    """
+    This function compares the files from two build manifests and returns
+    the sorted lists of paths that were added, changed, and deleted.
+    """
+    added = sorted(set(new_files) - set(old_files))
+    deleted = sorted(set(old_files) - set(new_files))
+    changed = sorted(
+        path
+        for path in set(old_files) & set(new_files)
+        if (old_files[path]["hash"], old_files[path]["content_type"])
+        != (new_files[path]["hash"], new_files[path]["content_type"])
+    )
+    return added, changed, deleted
+
+
+def sync_manifest_diff(target, source_dir, new_files, added, changed, deleted, workers=DEFAULT_SYNC_WORKERS):
+    """
+    This function pushes only the differences between two builds to a sync target.
+
+    Uploads are done in parallel, in waves: first everything that isn't an html page
+    (e.g. css, images, etc.), then the html pages, then the sitemaps that list the pages,
+    then the sitemap index that lists the sitemaps. That way nothing references a file
+    that hasn't been uploaded yet. Deletions happen last, so nothing is removed while
+    the previous pages might still reference it.
+    """
+    uploads = added + changed
+    sitemaps = [path for path in uploads if new_files[path].get("sitemap") == "shard"]
+    sitemap_indexes = [path for path in uploads if new_files[path].get("sitemap") == "index"]
+    pages = [
+        path
+        for path in uploads
+        if new_files[path]["content_type"] == "text/html" and not new_files[path].get("sitemap")
+    ]
+    assets = [path for path in uploads if path not in set(sitemaps + sitemap_indexes + pages)]
+
+    def upload(path):
+        logger.info(f"upload: {path}")
+        target.upload(path, os.path.join(source_dir, path), new_files[path])
+
+    def delete(path):
+        logger.info(f"delete: {path}")
+        target.delete(path)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() waits for each wave to finish (and re-raises any errors) before starting the next
+        for wave in (assets, pages, sitemaps, sitemap_indexes):
+            list(executor.map(upload, wave))
+        list(executor.map(delete, deleted))
+
+
+class Command(BaseCommand):
+    help = dedent(
+        """\
+        Run Cheap Static Site Generator (diff command) -
+        This command compares the manifests of two builds
+        made by the `runcheap_ssg_build` command and lists
+        the files that were added, changed, and deleted.
+        Optionally, it then syncs only those files to a
+        deployment target.
+    """
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "old_manifest",
+            metavar="OLD_MANIFEST",
+            help="Manifest of the previous (e.g. currently deployed) build (a missing file means an empty build)",
+        )
+        parser.add_argument(
+            "new_manifest",
+            metavar="NEW_MANIFEST",
+            help="Manifest of the new build (the new build's files are found from the manifest's location)",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Output the added, changed, and deleted files as json",
+        )
+        parser.add_argument(
+            "--sync-to",
+            metavar="STRING",
+            default=None,
+            help="Destination to sync the differences to (default is to not sync anything)",
+        )
+        parser.add_argument(
+            "--sync-target",
+            metavar="STRING",
+            default=DEFAULT_SYNC_TARGET,
+            help=f"Import path of the sync target class (default is '{DEFAULT_SYNC_TARGET}')",
+        )
+        parser.add_argument(
+            "--sync-workers",
+            metavar="INT",
+            type=int,
+            default=DEFAULT_SYNC_WORKERS,
+            help=f"How many files to upload or delete in parallel (default is {DEFAULT_SYNC_WORKERS})",
+        )
+
+    def handle(self, *args, **options):
+        if options["sync_workers"] < 1:
+            raise CommandError(f"--sync-workers must be at least 1 (got {options['sync_workers']})")
+        if not os.path.exists(options["new_manifest"]):
+            raise CommandError(f"New manifest not found: {options['new_manifest']}")
+        old_files = load_manifest(options["old_manifest"])["files"]
+        new_manifest = load_manifest(options["new_manifest"])
+        new_files = new_manifest["files"]
+        added, changed, deleted = diff_manifests(old_files, new_files)
+
+        # output the differences
+        if options["json"]:
+            self.stdout.write(json.dumps({"added": added, "changed": changed, "deleted": deleted}, indent=1))
+        else:
+            for prefix, paths in (("A", added), ("M", changed), ("D", deleted)):
+                for path in paths:
+                    self.stdout.write(f"{prefix} {path}")
+
+        # push the differences to the sync target
+        if options["sync_to"]:
+            manifest_path = os.path.abspath(options["new_manifest"])
+            build_dir = get_build_dir(manifest_path, new_manifest)
+            target = import_string(options["sync_target"])(options["sync_to"])
+            sync_manifest_diff(
+                target,
+                build_dir,
+                new_files,
+                added,
+                changed,
+                deleted,
+                workers=options["sync_workers"],
+            )
+            # the new manifest goes last, so the target's copy can be used as OLD_MANIFEST next time
+            manifest_name = os.path.relpath(manifest_path, build_dir).replace(os.sep, "/")
+            target.upload(manifest_name, manifest_path, get_manifest_entry(manifest_path))
+            logger.error(f"Synced {len(added)} added, {len(changed)} changed, {len(deleted)} deleted files")
@@ -1,13 +1,31 @@
 import os
 import logging
+import posixpath
+import importlib
+import threading
+from io import BytesIO
 from textwrap import dedent
 from http import HTTPStatus
+from collections import OrderedDict
 from tempfile import TemporaryDirectory
 from functools import partial
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse, unquote
+from concurrent.futures import ThreadPoolExecutor
 from http.server import HTTPServer, SimpleHTTPRequestHandler
+from django.core.exceptions import SuspiciousFileOperation
 from django.core.management.base import BaseCommand
 from django.core.management import call_command
 from django.conf import settings
+from django.contrib.staticfiles.finders import get_finder
+from django.utils.translation import override
+from runcheap_ssg.management.commands.runcheap_ssg_build import (
+    DEFAULT_REDIRECT_STYLE,
+    DEFAULT_REDIRECT_MESSAGE,
+    DEFAULT_REDIRECT_NOSCRIPT,
+    get_static_urls,
+    render_static_content,
+)
 
 DEFAULT_HOST = getattr(
     settings,
@@ -19,6 +37,16 @@ DEFAULT_PORT = getattr(
     "RUNCHEAP_SSG_SERVE_PORT",
     8000,
 )
+DEFAULT_CACHE_SIZE = getattr(
+    settings,
+    "RUNCHEAP_SSG_SERVE_CACHE_SIZE",
+    64 * 1024 * 1024,
+)
+DEFAULT_PREFETCH_WORKERS = getattr(
+    settings,
+    "RUNCHEAP_SSG_SERVE_PREFETCH_WORKERS",
+    2,
+)
 
 logger = logging.getLogger("django.runcheap_ssg.serve_static")
 
@@ -60,6 +88,291 @@ class StaticHttpRequestHandler(SimpleHTTPRequestHandler):
         return file_obj
 
 
+class RenderCache:
+    """
+    Thread-safe least-recently-used cache of rendered static files (content path --> bytes).
+
+    When the cached content is more than `max_size` bytes, the least recently used files
+    are moved out of memory, either into `spill_dir` (if set) or dropped entirely.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, spill_dir=None):
+        self.max_size = max_size
+        self.spill_dir = spill_dir
+        self.memory = OrderedDict()
+        self.memory_size = 0
+        self.spilled = set()
+        self.lock = threading.RLock()
+
+    def _spill_path(self, content_path):
+        return os.path.join(self.spill_dir, content_path[1:])
+
+    def __contains__(self, content_path):
+        "Check if the path is cached (without loading it or changing the least recently used order)"
+        with self.lock:
+            return content_path in self.memory or content_path in self.spilled
+
+    def get(self, content_path):
+        "Return the cached content for the path (or None if it's not cached)"
+        with self.lock:
+            if content_path in self.memory:
+                self.memory.move_to_end(content_path)
+                return self.memory[content_path]
+            if content_path in self.spilled:
+                with open(self._spill_path(content_path), "rb") as spill_file:
+                    content = spill_file.read()
+                self.set(content_path, content)
+                return content
+        return None
+
+    def set(self, content_path, content):
+        "Cache the content for the path, moving the least recently used content out of memory if needed"
+        with self.lock:
+            self.invalidate(content_path)
+            self.memory[content_path] = content
+            self.memory_size += len(content)
+            while self.memory_size > self.max_size and self.memory:
+                old_path, old_content = self.memory.popitem(last=False)
+                self.memory_size -= len(old_content)
+                if self.spill_dir:
+                    spill_path = self._spill_path(old_path)
+                    os.makedirs(os.path.dirname(spill_path), exist_ok=True)
+                    with open(spill_path, "wb") as spill_file:
+                        spill_file.write(old_content)
+                    self.spilled.add(old_path)
+
+    def invalidate(self, content_path):
+        "Remove the path from the cache (so it's rendered again the next time it's requested)"
+        with self.lock:
+            if content_path in self.memory:
+                self.memory_size -= len(self.memory.pop(content_path))
+            if content_path in self.spilled:
+                self.spilled.discard(content_path)
+                os.remove(self._spill_path(content_path))
+
+
+class LinkParser(HTMLParser):
+    "Collects the urls of links, stylesheets, scripts, images, etc. in an html page"
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        for name, value in attrs:
+            if name in {"href", "src"} and value:
+                self.links.append(value)
+
+
+class LazyStaticSite:
+    """
+    Static site that renders each file the first time it's requested, instead of building
+    the whole site up front. At startup, only the urls of the site are found (without rendering
+    them), then files are rendered with the same pipeline as the `runcheap_ssg_build` command,
+    so the served content is byte-identical to the built static site.
+
+    Rendered files are kept in a RenderCache, and pages linked from a rendered html page
+    are rendered in the background (`prefetch_workers` at a time, 0 to disable prefetching).
+    """
+
+    def __init__(
+        self,
+        urlconf=settings.ROOT_URLCONF,
+        cache=None,
+        prefetch_workers=DEFAULT_PREFETCH_WORKERS,
+    ):
+        self.cache = cache or RenderCache()
+        self.render_lock = threading.Lock()
+        self.redirect_context = {
+            "redirect_style": DEFAULT_REDIRECT_STYLE,
+            "redirect_message": DEFAULT_REDIRECT_MESSAGE,
+            "redirect_noscript": DEFAULT_REDIRECT_NOSCRIPT,
+        }
+        self.prefetcher = ThreadPoolExecutor(max_workers=prefetch_workers) if prefetch_workers else None
+        self.prefetching = set()
+        self.prefetch_lock = threading.Lock()
+
+        # find the urls to render (and the language to render them in)
+        urlconf_module = importlib.import_module(urlconf)
+        self.view_urls = {}
+        self.rendered_paths = {}
+        for view_url, page in get_static_urls(urlconf_module.urlpatterns):
+            self.view_urls[view_url] = page["language"]
+        logger.info(f"Found {len(self.view_urls)} urls to render on demand")
+
+    def get_view_urls(self, content_path):
+        """
+        Return the urls that could be rendered to the static file path (see render_static_content()),
+        skipping urls that are already known to render to a different path (e.g. "/about" --> "/about.html")
+        """
+        view_urls = [content_path]
+        if content_path.endswith("/index.html"):
+            view_urls.append(content_path.removesuffix("index.html"))
+        elif content_path.endswith(".html"):
+            view_urls.append(content_path.removesuffix(".html"))
+        return [
+            view_url
+            for view_url in view_urls
+            if view_url in self.view_urls and self.rendered_paths.get(view_url, content_path) == content_path
+        ]
+
+    def get_staticfile(self, content_path):
+        "Return the source path of a django staticfiles file (the same file the build would copy)"
+        if not settings.STATIC_URL:
+            return None
+        static_prefix = urlparse(settings.STATIC_URL).path
+        static_prefix = static_prefix if static_prefix.startswith("/") else "/" + static_prefix
+        if not content_path.startswith(static_prefix):
+            return None
+        static_path = content_path.removeprefix(static_prefix)
+
+        # the build copies every finder's storages in order (see the finders' list() methods),
+        # so the last storage with the file wins
+        source_path = None
+        try:
+            for finder_import in settings.STATICFILES_FINDERS:
+                static_finder = get_finder(finder_import)
+                storages = getattr(static_finder, "storages", None)
+                # fallback for finders without storages (only their first match is known)
+                if storages is None:
+                    source_path = static_finder.find(static_path) or source_path
+                    continue
+                for storage in storages.values():
+                    prefix = getattr(storage, "prefix", None)
+                    if prefix and not static_path.startswith(prefix + "/"):
+                        continue
+                    base_path = static_path.removeprefix(prefix + "/") if prefix else static_path
+                    if storage.exists(base_path):
+                        source_path = storage.path(base_path)
+        except SuspiciousFileOperation:
+            return None
+        return source_path
+
+    def get_content(self, content_path):
+        "Return the content of the static file path, rendering it if needed (or None if it's not in the site)"
+        content = self.cache.get(content_path)
+        if content is not None:
+            return content
+
+        # staticfiles are copied over the rendered pages in the build, so check for them first
+        source_path = self.get_staticfile(content_path)
+        if source_path:
+            with open(source_path, "rb") as source_file:
+                return source_file.read()
+
+        for view_url in self.get_view_urls(content_path):
+            with self.render_lock:
+                content = self.cache.get(content_path)
+                if content is not None:
+                    return content
+                with override(self.view_urls[view_url]):
+                    rendered_path, content_iter, _ = render_static_content(view_url, self.redirect_context)
+                    content = b"".join(content_iter)
+                self.cache.set(rendered_path, content)
+                self.rendered_paths[view_url] = rendered_path
+            if rendered_path == content_path:
+                logger.info(f"rendered: {content_path}")
+                return content
+        return None
+
+    def prefetch(self, content_path, content):
+        "Render the pages linked from an html page in the background"
+        if self.prefetcher is None or not content_path.endswith(".html"):
+            return
+        parser = LinkParser()
+        parser.feed(content.decode(errors="replace"))
+        for link in parser.links:
+            url = urlparse(urljoin(content_path, link))
+            if url.scheme or url.netloc:
+                continue
+            link_path = unquote(url.path)
+            link_path = link_path + "index.html" if link_path.endswith("/") else link_path
+            for linked_path in (link_path, link_path + ".html"):
+                if self.get_view_urls(linked_path):
+                    with self.prefetch_lock:
+                        # skip pages that are already cached or waiting to be rendered
+                        if linked_path not in self.cache and linked_path not in self.prefetching:
+                            self.prefetching.add(linked_path)
+                            self.prefetcher.submit(self._prefetch_content, linked_path)
+                    break
+
+    def _prefetch_content(self, content_path):
+        try:
+            self.get_content(content_path)
+        finally:
+            with self.prefetch_lock:
+                self.prefetching.discard(content_path)
+
+    def invalidate(self, url_path):
+        "Remove a url's static files from the cache, so they are rendered again"
+        content_path = url_path + "index.html" if url_path.endswith("/") else url_path
+        # wait for any render in progress, so content rendered before the purge isn't cached after it
+        with self.render_lock:
+            for path in (content_path, content_path + ".html"):
+                self.cache.invalidate(path)
+
+
+class LazyHttpRequestHandler(StaticHttpRequestHandler):
+    """
+    Request handler for a LazyStaticSite, with the same file-checking logic as StaticHttpRequestHandler.
+    Sending a PURGE request for a url removes the url's rendered files from the cache.
+    """
+
+    def __init__(self, *args, site=None, **kwargs):
+        self.site = site
+        super().__init__(*args, **kwargs)
+
+    def get_request_path(self):
+        "Return the request's normalized url path (or None if the path leaves the site's root)"
+        # (query and fragment are split off like translate_path() does, so "//a/b" isn't parsed as a host)
+        path = unquote(self.path.split("?", 1)[0].split("#", 1)[0])
+        rel_path = posixpath.normpath(path.lstrip("/"))
+        if rel_path == ".." or rel_path.startswith("../"):
+            return None
+        norm_path = "/" if rel_path == "." else "/" + rel_path
+        if path.endswith("/") and not norm_path.endswith("/"):
+            norm_path += "/"
+        return norm_path
+
+    def send_head(self):
+        "Override to serve rendered content instead of files"
+
+        # ending-slash means index in that folder
+        path = self.get_request_path()
+        if path is None:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+        if path.endswith("/"):
+            path += "index.html"
+
+        # try to load the path's file directly, then fallback to try the path with an html extension
+        content = self.site.get_content(path)
+        if content is None:
+            path += ".html"
+            content = self.site.get_content(path)
+            if content is None:
+                self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+                return None
+        self.site.prefetch(path, content)
+
+        # send header for file
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        return BytesIO(content)
+
+    def do_PURGE(self):
+        path = self.get_request_path()
+        if path is None:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return
+        self.site.invalidate(path)
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
 class Command(BaseCommand):
     help = dedent(
         """\
@@ -68,7 +381,8 @@ class Command(BaseCommand):
         to build the static site, then starts a simple http
         server to serve the static site. ONLY USE THIS FOR
         LOCAL DEVELOPMENT. Use a real http server (e.g. nginx)
-        for serving your static site publicly.
+        for serving your static site publicly. With --lazy,
+        pages are instead rendered when they're requested.
     """
     )
 
@@ -77,7 +391,10 @@ class Command(BaseCommand):
             "--directory",
             metavar="STRING",
             default=None,
-            help="Where to put the built static site (default is a temporary directory that's deleted on quit)",
+            help=(
+                "Where to put the built static site, or with --lazy, the rendered pages that don't fit in memory "
+                "(default is a temporary directory that's deleted on quit)"
+            ),
         )
         parser.add_argument(
             "--host",
@@ -92,18 +409,50 @@ class Command(BaseCommand):
             default=DEFAULT_PORT,
             help=f"Port to listen on (default is {DEFAULT_PORT})",
         )
+        parser.add_argument(
+            "--lazy",
+            action="store_true",
+            help="Don't build the static site up front, render each page the first time it's requested instead",
+        )
+        parser.add_argument(
+            "--cache-size",
+            metavar="INT",
+            type=int,
+            default=DEFAULT_CACHE_SIZE,
+            help=f"With --lazy, max bytes of rendered pages to keep in memory (default is {DEFAULT_CACHE_SIZE})",
+        )
+        parser.add_argument(
+            "--prefetch-workers",
+            metavar="INT",
+            type=int,
+            default=DEFAULT_PREFETCH_WORKERS,
+            help=(
+                "With --lazy, how many linked pages to render at once in the background "
+                f"(default is {DEFAULT_PREFETCH_WORKERS}, 0 to disable prefetching)"
+            ),
+        )
 
     def handle(self, *args, **options):
         with TemporaryDirectory() as tmpdirname:
-            if options["directory"]:
+            if options["lazy"]:
+                # pages that don't fit in memory are spilled to --directory (or the temporary directory)
+                directory = os.path.abspath(options["directory"] or tmpdirname)
+                logger.info(f"Rendering pages on demand, spilling cached pages to: {directory}")
+                site = LazyStaticSite(
+                    cache=RenderCache(max_size=options["cache_size"], spill_dir=directory),
+                    prefetch_workers=options["prefetch_workers"],
+                )
+                handler = partial(LazyHttpRequestHandler, site=site)
+            elif options["directory"]:
                 directory = os.path.abspath(options["directory"])
                 logger.info(f"Using directory: {directory}")
+                handler = partial(StaticHttpRequestHandler, directory=directory)
             else:
                 directory = os.path.abspath(tmpdirname)
                 logger.info(f"No directory provided, building and using temporary directory: {directory}")
                 call_command("runcheap_ssg_build", output=directory)
+                handler = partial(StaticHttpRequestHandler, directory=directory)
 
-            handler = partial(StaticHttpRequestHandler, directory=directory)
             server = HTTPServer((options["host"], options["port"]), handler)
             logger.error(f"Serving HTTP on {options['host']}:{options['port']}... (Ctrl+c to quit)")
             try:
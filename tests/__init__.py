@@ -0,0 +1,20 @@
+import django
+from django.conf import settings
+
+# minimal django settings for the tests (settings are read when the commands are imported)
+if not settings.configured:
+    settings.configure(
+        SECRET_KEY="unused",
+        ALLOWED_HOSTS=["*"],
+        INSTALLED_APPS=["django.contrib.staticfiles", "runcheap_ssg"],
+        ROOT_URLCONF="tests.urls",
+        STATIC_URL="assets/",
+        MIDDLEWARE=[
+            "django.middleware.locale.LocaleMiddleware",
+            "django.middleware.common.CommonMiddleware",
+        ],
+        TEMPLATES=[{"BACKEND": "django.template.backends.django.DjangoTemplates", "APP_DIRS": True}],
+        LANGUAGE_CODE="en",
+        LANGUAGES=[("en", "English"), ("nl", "Dutch")],
+    )
+    django.setup()
@@ -0,0 +1,104 @@
+import os
+import json
+import threading
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from runcheap_ssg.management.commands.runcheap_ssg_build import save_manifest
+from runcheap_ssg.management.commands.runcheap_ssg_diff import (
+    LocalDirectoryTarget,
+    diff_manifests,
+    sync_manifest_diff,
+)
+
+
+def entry(content_hash, content_type="text/html", **kwargs):
+    return {"hash": content_hash, "size": 1, "content_type": content_type} | kwargs
+
+
+class RecordingTarget:
+    "Sync target that records the order of uploads and deletes"
+
+    def __init__(self, destination=None):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def upload(self, path, source_path, entry):
+        with self.lock:
+            self.calls.append(("upload", path))
+
+    def delete(self, path):
+        with self.lock:
+            self.calls.append(("delete", path))
+
+
+class DiffManifestsTest(TestCase):
+    def test_added_changed_deleted(self):
+        old_files = {"a.html": entry("1"), "b.html": entry("2"), "c.css": entry("3", "text/css")}
+        new_files = {"a.html": entry("1"), "b.html": entry("changed"), "d.js": entry("4", "text/javascript")}
+        self.assertEqual(diff_manifests(old_files, new_files), (["d.js"], ["b.html"], ["c.css"]))
+
+    def test_content_type_change_is_changed(self):
+        added, changed, deleted = diff_manifests({"a": entry("1", "text/plain")}, {"a": entry("1", "text/html")})
+        self.assertEqual(changed, ["a"])
+
+
+class SyncManifestDiffTest(TestCase):
+    def test_upload_order(self):
+        new_files = {
+            "index.html": entry("1"),
+            "about/index.html": entry("2"),
+            "assets/site.css": entry("3", "text/css"),
+            "sitemap.xml": entry("4", "application/xml", sitemap="index"),
+            "sitemap-1.xml": entry("5", "application/xml", sitemap="shard"),
+            "robots.txt": entry("6", "text/plain"),
+        }
+        target = RecordingTarget()
+        sync_manifest_diff(target, "/unused", new_files, sorted(new_files), [], ["old.html"], workers=4)
+
+        waves = [path for _, path in target.calls]
+        self.assertEqual(set(waves[:2]), {"assets/site.css", "robots.txt"})
+        self.assertEqual(set(waves[2:4]), {"index.html", "about/index.html"})
+        self.assertEqual(waves[4:], ["sitemap-1.xml", "sitemap.xml", "old.html"])
+        self.assertEqual(target.calls[-1], ("delete", "old.html"))
+
+
+class LocalDirectoryTargetTest(TestCase):
+    def test_delete_removes_empty_folders(self):
+        with TemporaryDirectory() as tmpdir:
+            os.makedirs(os.path.join(tmpdir, "blog", "old-entry"))
+            os.makedirs(os.path.join(tmpdir, "blog", "keep"))
+            open(os.path.join(tmpdir, "blog", "old-entry", "index.html"), "w").close()
+            LocalDirectoryTarget(tmpdir).delete("blog/old-entry/index.html")
+            self.assertEqual(os.listdir(tmpdir), ["blog"])
+            self.assertEqual(os.listdir(os.path.join(tmpdir, "blog")), ["keep"])
+
+
+class DiffCommandTest(TestCase):
+    def test_sync_nested_manifest(self):
+        with TemporaryDirectory() as build_dir, TemporaryDirectory() as deploy_dir:
+            with open(os.path.join(build_dir, "index.html"), "w") as f:
+                f.write("<p>hi</p>")
+            manifest_path = save_manifest(build_dir, "meta/manifest.json", {"index.html": entry("1")})
+
+            call_command(
+                "runcheap_ssg_diff",
+                os.path.join(deploy_dir, "meta", "manifest.json"),
+                manifest_path,
+                sync_to=deploy_dir,
+                stdout=open(os.devnull, "w"),
+            )
+            with open(os.path.join(deploy_dir, "index.html")) as f:
+                self.assertEqual(f.read(), "<p>hi</p>")
+            with open(os.path.join(deploy_dir, "meta", "manifest.json")) as f:
+                self.assertEqual(json.load(f)["path"], "meta/manifest.json")
+
+    def test_manifest_outside_build_dir(self):
+        with TemporaryDirectory() as build_dir:
+            with self.assertRaises(ValueError):
+                save_manifest(build_dir, "../manifest.json", {})
+
+    def test_sync_workers_validated(self):
+        with self.assertRaises(CommandError):
+            call_command("runcheap_ssg_diff", "old.json", "new.json", sync_workers=0)
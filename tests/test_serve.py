@@ -0,0 +1,103 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock
+from runcheap_ssg.management.commands import runcheap_ssg_serve
+from runcheap_ssg.management.commands.runcheap_ssg_build import get_static_content
+from runcheap_ssg.management.commands.runcheap_ssg_serve import LazyHttpRequestHandler, LazyStaticSite, RenderCache
+from tests import urls
+
+
+class RenderCacheTest(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = RenderCache(max_size=10)
+        cache.set("/a", b"aaaa")
+        cache.set("/b", b"bbbb")
+        cache.get("/a")
+        cache.set("/c", b"cccc")
+        self.assertEqual(cache.get("/a"), b"aaaa")
+        self.assertIsNone(cache.get("/b"))
+        self.assertNotIn("/b", cache)
+
+    def test_spills_to_disk(self):
+        with TemporaryDirectory() as tmpdir:
+            cache = RenderCache(max_size=10, spill_dir=tmpdir)
+            cache.set("/a/index.html", b"aaaa")
+            cache.set("/b", b"bbbb")
+            cache.set("/c", b"cccc")
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, "a", "index.html")))
+
+            # membership checks don't load spilled content
+            self.assertIn("/a/index.html", cache)
+            self.assertNotIn("/a/index.html", cache.memory)
+            self.assertEqual(cache.get("/a/index.html"), b"aaaa")
+            self.assertIn("/a/index.html", cache.memory)
+
+            cache.invalidate("/a/index.html")
+            self.assertNotIn("/a/index.html", cache)
+            self.assertFalse(os.path.exists(os.path.join(tmpdir, "a", "index.html")))
+
+
+class LazyStaticSiteTest(TestCase):
+    def setUp(self):
+        self.site = LazyStaticSite(urlconf="tests.urls", prefetch_workers=0)
+        self.render = mock.patch.object(
+            runcheap_ssg_serve, "render_static_content", wraps=runcheap_ssg_serve.render_static_content
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_same_content_as_build(self):
+        redirect_context = self.site.redirect_context
+        for content_path, content_iter in get_static_content(urls.urlpatterns, redirect_context=redirect_context):
+            self.assertEqual(self.site.get_content(content_path), b"".join(content_iter), content_path)
+
+    def test_renders_once(self):
+        for _ in range(3):
+            self.site.get_content("/en/about/index.html")
+        self.assertEqual(self.render.call_count, 1)
+
+    def test_renders_extensionless_url_once(self):
+        # "/en/about" is a redirect page, which renders to "/en/about.html"
+        for _ in range(3):
+            self.assertIsNone(self.site.get_content("/en/about"))
+            self.assertIn(b"/en/about/", self.site.get_content("/en/about.html"))
+        self.assertEqual(self.render.call_count, 1)
+
+    def test_invalidate(self):
+        self.site.get_content("/en/about/index.html")
+        self.site.invalidate("/en/about/")
+        self.site.get_content("/en/about/index.html")
+        self.assertEqual(self.render.call_count, 2)
+
+    def test_not_in_site(self):
+        self.assertIsNone(self.site.get_content("/not-included/index.html"))
+        self.assertIsNone(self.site.get_content("/assets/../tests/urls.py"))
+
+    def test_prefetch_skips_cached_and_queued(self):
+        self.site.prefetcher = mock.Mock()
+        content = self.site.get_content("/en/about/index.html")
+        self.site.prefetch("/en/about/index.html", content)
+        self.site.prefetch("/en/about/index.html", content)
+        # the page itself is cached and the linked page is only queued once
+        self.assertEqual(self.site.prefetching, {"/non-i18n/index.html"})
+        self.assertEqual(self.site.prefetcher.submit.call_count, 1)
+
+    def test_prefetch_extensionless_link(self):
+        self.site.prefetcher = mock.Mock()
+        self.site.get_content("/en/about")
+        self.site.prefetch("/page.html", b'<a href="/en/about">about</a>')
+        self.site.prefetcher.submit.assert_not_called()
+
+
+class LazyHttpRequestHandlerTest(TestCase):
+    def get_request_path(self, path):
+        handler = LazyHttpRequestHandler.__new__(LazyHttpRequestHandler)
+        handler.path = path
+        return handler.get_request_path()
+
+    def test_request_path(self):
+        self.assertEqual(self.get_request_path("/"), "/")
+        self.assertEqual(self.get_request_path("/en/about/?x=1"), "/en/about/")
+        self.assertEqual(self.get_request_path("//en/./about"), "/en/about")
+        self.assertEqual(self.get_request_path("/.well-known/x"), "/.well-known/x")
+        self.assertIsNone(self.get_request_path("/assets/../../settings.py"))
+        self.assertIsNone(self.get_request_path("/assets/%2e%2e/%2e%2e/settings.py"))
@@ -0,0 +1,90 @@
+import os
+from datetime import date, datetime, timezone
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from xml.dom import minidom
+from django.conf import settings
+from django.test import override_settings
+from runcheap_ssg.management.commands.runcheap_ssg_build import SitemapWriter, get_static_content
+from tests import urls
+
+
+def read_locs(path):
+    return [loc.firstChild.data for loc in minidom.parse(path).getElementsByTagName("loc")]
+
+
+class SitemapWriterTest(TestCase):
+    def test_split_by_urls(self):
+        class SmallSitemapWriter(SitemapWriter):
+            MAX_URLS = 2
+
+        with TemporaryDirectory() as tmpdir:
+            writer = SmallSitemapWriter(tmpdir, "https://example.com/")
+            for n in range(5):
+                writer.add(f"/page/{n}/")
+            paths = writer.close()
+
+            names = [os.path.basename(p) for p in paths]
+            self.assertEqual(names, ["sitemap-1.xml", "sitemap-2.xml", "sitemap-3.xml", "sitemap.xml"])
+            self.assertEqual(read_locs(paths[0]), ["https://example.com/page/0/", "https://example.com/page/1/"])
+            self.assertEqual(read_locs(paths[2]), ["https://example.com/page/4/"])
+            self.assertEqual(read_locs(paths[-1]), [f"https://example.com/sitemap-{n}.xml" for n in (1, 2, 3)])
+
+    def test_split_by_bytes(self):
+        class SmallSitemapWriter(SitemapWriter):
+            MAX_BYTES = 400
+
+        with TemporaryDirectory() as tmpdir:
+            writer = SmallSitemapWriter(tmpdir, "https://example.com")
+            for n in range(10):
+                writer.add(f"/page/{n}/")
+            paths = writer.close()
+
+            self.assertGreater(len(paths), 2)
+            for path in paths[:-1]:
+                self.assertLessEqual(os.path.getsize(path), SmallSitemapWriter.MAX_BYTES)
+            self.assertEqual(sum(len(read_locs(p)) for p in paths[:-1]), 10)
+
+    @override_settings(USE_TZ=True, TIME_ZONE="UTC")
+    def test_lastmod_and_alternates(self):
+        with TemporaryDirectory() as tmpdir:
+            writer = SitemapWriter(tmpdir, "https://example.com")
+            writer.add("/a/", lastmod=datetime(2024, 1, 1, 10))
+            writer.add("/b/", lastmod=datetime(2024, 1, 1, 10, tzinfo=timezone.utc))
+            writer.add("/c/", lastmod=date(2024, 1, 1))
+            writer.add("/en/d/?x=1&y=2", alternates={"en": "/en/d/", "nl": "/nl/d/"})
+            paths = writer.close()
+
+            doc = minidom.parse(paths[0])
+            lastmods = [node.firstChild.data for node in doc.getElementsByTagName("lastmod")]
+            self.assertEqual(lastmods, ["2024-01-01T10:00:00+00:00", "2024-01-01T10:00:00+00:00", "2024-01-01"])
+            self.assertEqual(read_locs(paths[0])[-1], "https://example.com/en/d/?x=1&y=2")
+            links = doc.getElementsByTagName("xhtml:link")
+            self.assertEqual([link.getAttribute("hreflang") for link in links], ["en", "nl"])
+            self.assertEqual(links[1].getAttribute("href"), "https://example.com/nl/d/")
+
+    def test_index_name_must_be_in_root(self):
+        with TemporaryDirectory() as tmpdir:
+            for index_name in ("", "maps/sitemap.xml", ".."):
+                with self.assertRaises(ValueError):
+                    SitemapWriter(tmpdir, "https://example.com", index_name=index_name)
+
+
+class SitemapContentTest(TestCase):
+    def test_only_html_pages(self):
+        with TemporaryDirectory() as tmpdir:
+            writer = SitemapWriter(tmpdir, "https://example.com")
+            redirect_context = {"redirect_style": "", "redirect_message": "", "redirect_noscript": ""}
+            for content_path, content_iter in get_static_content(
+                urls.urlpatterns, redirect_context=redirect_context, sitemap=writer
+            ):
+                list(content_iter)
+            paths = writer.close()
+
+            # redirects (e.g. /about/ and /en/about) and the 404 page aren't included
+            self.assertEqual(
+                read_locs(paths[0]),
+                ["https://example.com/en/about/", "https://example.com/nl/about/", "https://example.com/non-i18n/"],
+            )
+            links = minidom.parse(paths[0]).getElementsByTagName("xhtml:link")
+            self.assertEqual(len(links), 2 * len(settings.LANGUAGES))
@@ -0,0 +1,20 @@
+from django.conf.urls.i18n import i18n_patterns
+from django.http import Http404, HttpResponse
+from django.urls import path
+from runcheap_ssg.decorators import include_in_ssg
+
+
+def page_view(request):
+    return HttpResponse(f'<a href="{request.path}">self</a> <a href="/non-i18n/">non-i18n</a>')
+
+
+def missing_view(request):
+    raise Http404
+
+
+urlpatterns = i18n_patterns(
+    path("about/", include_in_ssg(page_view), name="about"),
+) + [
+    path("non-i18n/", include_in_ssg(page_view), name="non-i18n"),
+    path("missing/", include_in_ssg(missing_view), name="missing"),
+]